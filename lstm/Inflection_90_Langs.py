@@ -11,8 +11,8 @@ import pandas as pd
 
 
 from configs import training_mode, data_dir, tsv_dir, languages, log_file, load_model, save_model, num_epochs, \
-    learning_rate, batch_size, encoder_embedding_size, decoder_embedding_size, hidden_size, num_layers, \
-    encoder_dropout, decoder_dropout, comment, excel_results_file
+    learning_rate, batch_size, teacher_force_ratio, encoder_embedding_size, decoder_embedding_size, hidden_size, \
+    num_layers, encoder_dropout, decoder_dropout, comment, excel_results_file
 from utils import translate_sentence, evaluate_model, save_checkpoint, load_checkpoint, get_languages_and_paths, \
     save_run_results_figure, srcField, trgField, device, eval_edit_distance, reinflection2TSV, INFLECTION_STR, \
     print_and_log
@@ -98,7 +98,7 @@ for j, language in enumerate(languages):
             target = batch.trg.to(device)
 
             # Forward prop
-            output = model(inp_data, target)
+            output = model(inp_data, target, teacher_force_ratio)
 
             # Output is of shape (trg_len, batch_size, output_dim) but Cross Entropy Loss
             # doesn't take input in that form. For example if we have MNIST we want to have
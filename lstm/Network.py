@@ -1,7 +1,5 @@
-import random
-
 import torch.nn as nn
-from torch import cat, einsum, zeros
+from torch import cat, einsum, rand, zeros
 
 from utils import device, srcField, trgField
 
@@ -52,18 +50,39 @@ class Decoder(nn.Module):
         self.softmax = nn.Softmax(dim=0)
         self.relu = nn.ReLU()
 
-    def forward(self, x, encoder_states, hidden, cell, return_attn=False):
+    def forward(self, x, encoder_states, hidden, cell, return_attn=False, encoder_energy=None):
         x = x.unsqueeze(0)
         # x: (1, N) where N is the batch size
 
         embedding = self.dropout(self.embedding(x))
         # embedding shape: (1, N, embedding_size)
 
-        sequence_length = encoder_states.shape[0]
-        h_reshaped = hidden.repeat(sequence_length, 1, 1)
-        # h_reshaped: (seq_length, N, hidden_size*2)
+        outputs, hidden, cell, attention = self.step(embedding, encoder_states, hidden, cell, encoder_energy)
+
+        predictions = self.fc(outputs).squeeze(0)
+        # predictions: (N, hidden_size)
+
+        attn = attention if return_attn else None
+        return predictions, hidden, cell, attn
 
-        energy = self.relu(self.energy(cat((h_reshaped, encoder_states), dim=2)))
+    def project_encoder_states(self, encoder_states):
+        """
+        The encoder part of the attention energy, i.e. self.energy applied to the encoder states only. It doesn't
+        depend on the decoding step, so it can be computed once per batch and passed to every step.
+        """
+        return nn.functional.linear(encoder_states, self.energy.weight[:, self.hidden_size:], self.energy.bias)
+
+    def step(self, embedding, encoder_states, hidden, cell, encoder_energy=None):
+        """
+        A single step of the attention and the LSTM, without the output layer (fc), so that the latter can be applied
+        to many steps at once.
+        """
+        if encoder_energy is None: encoder_energy = self.project_encoder_states(encoder_states)
+        # encoder_energy: (seq_length, N, 1)
+
+        # Equivalent to self.energy(cat((h_reshaped, encoder_states), dim=2)) with hidden repeated seq_length times,
+        # as the hidden part of the energy is broadcast over the sequence instead.
+        energy = self.relu(encoder_energy + nn.functional.linear(hidden, self.energy.weight[:, :self.hidden_size]))
         # energy: (seq_length, N, 1)
 
         attention = self.softmax(energy)
@@ -80,11 +99,7 @@ class Decoder(nn.Module):
         outputs, (hidden, cell) = self.rnn(rnn_input, (hidden, cell))
         # outputs shape: (1, N, hidden_size)
 
-        predictions = self.fc(outputs).squeeze(0)
-        # predictions: (N, hidden_size)
-
-        attn = attention if return_attn else None
-        return predictions, hidden, cell, attn
+        return outputs, hidden, cell, attention
 
 
 class Seq2Seq(nn.Module):
@@ -104,30 +119,46 @@ class Seq2Seq(nn.Module):
     def forward(self, source, target, teacher_force_ratio=0.5):
         batch_size = source.shape[1]
         target_len = target.shape[0]
-        target_vocab_size = len(trgField.vocab)
+        target_vocab_size = self.decoder.fc.out_features
 
-        outputs = zeros(target_len, batch_size, target_vocab_size).to(device)
+        outputs = zeros(target_len, batch_size, target_vocab_size, device=target.device)
         encoder_states, hidden, cell = self.encoder(source)
+        encoder_energy = self.decoder.project_encoder_states(encoder_states)
+
+        if teacher_force_ratio >= 1:
+            # Fast path: the inputs are known in advance, so embed them all at once, and apply the output layer
+            # to the LSTM outputs of all the steps in a single matmul.
+            embeddings = self.decoder.dropout(self.decoder.embedding(target[:-1]))
+            # embeddings: (target_len - 1, N, embedding_size)
+            decoder_outputs = []
+            for t in range(target_len - 1):
+                output, hidden, cell, _ = self.decoder.step(embeddings[t:t + 1], encoder_states, hidden, cell,
+                                                            encoder_energy)
+                decoder_outputs.append(output)
+            outputs[1:] = self.decoder.fc(cat(decoder_outputs, dim=0))
+            return outputs
+
+        # With probability of teacher_force_ratio we take the actual next word
+        # otherwise we take the word that the Decoder predicted it to be.
+        # Teacher Forcing is used so that the model gets used to seeing
+        # similar inputs at training and testing time, if teacher forcing is 1
+        # then inputs at test time might be completely different than what the
+        # network is used to. This was a long comment.
+        # The decisions are sampled once per batch; teacher_force[t] decides the input of step t+1.
+        teacher_force = (rand(target_len) < teacher_force_ratio).tolist()
 
         # First input will be <SOS> token
         x = target[0]
 
         for t in range(1, target_len):
             # At every time step use encoder_states and update hidden, cell
-            output, hidden, cell, _ = self.decoder(x, encoder_states, hidden, cell)
+            output, hidden, cell, _ = self.decoder(x, encoder_states, hidden, cell, encoder_energy=encoder_energy)
 
             # Store prediction for current time step
             outputs[t] = output
 
-            # Get the best word the Decoder predicted (index in the vocabulary)
-            best_guess = output.argmax(1)
-
-            # With probability of teacher_force_ratio we take the actual next word
-            # otherwise we take the word that the Decoder predicted it to be.
-            # Teacher Forcing is used so that the model gets used to seeing
-            # similar inputs at training and testing time, if teacher forcing is 1
-            # then inputs at test time might be completely different than what the
-            # network is used to. This was a long comment.
-            x = target[t] if random.random() < teacher_force_ratio else best_guess
+            # Get the best word the Decoder predicted (index in the vocabulary), only if it is going to be used
+            if t < target_len - 1:
+                x = target[t] if teacher_force[t] else output.argmax(1)
 
         return outputs
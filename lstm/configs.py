@@ -27,6 +27,7 @@ save_model = True
 num_epochs = 50
 learning_rate = 3e-4
 batch_size = 32
+teacher_force_ratio = 0.5  # 1.0 enables the fast path of Seq2Seq.forward
 
 # Model hyperparameters
 encoder_embedding_size = 300
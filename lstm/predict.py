@@ -0,0 +1,184 @@
+"""
+Stream predictions of a trained model for a large file (or stdin) of inflection samples.
+
+Every input row is either `lemma\tfeat`, or `lemma\tform\tfeat` (SIGMORPHON format) when the gold forms are known.
+Every output row is `lemma\tprediction\tfeat`, in the input order. If gold forms are given, the accuracy & the average
+edit distance are computed on the fly and printed to stderr at the end.
+
+The rows are read in chunks of --chunk-size, so memory is bounded regardless of the input size. Within every chunk
+the samples are sorted by length and decoded in batches of identical length, so no padding is involved and the
+predictions are identical to those of translate_sentence.
+
+Example:
+    python predict.py --language tgk --input ../LemmaSplitData/iranian/tgk.tst --output tgk.pred --workers 4
+"""
+import sys
+from argparse import ArgumentParser, ArgumentTypeError
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import groupby, islice
+from multiprocessing import get_context
+from os.path import join
+
+import torch
+from torchtext.legacy.data import TabularDataset
+
+from configs import training_mode, data_dir, tsv_dir, batch_size, encoder_embedding_size, decoder_embedding_size, \
+    hidden_size, num_layers, encoder_dropout, decoder_dropout
+from utils import translate_batch, get_languages_and_paths, srcField, trgField, device, eval_edit_distance, \
+    reinflection2TSV, reinflection2sample, INFLECTION_STR
+from Network import Seq2Seq
+
+model = None  # set by init_model, once per process
+
+
+def init_model(language, checkpoint_path, num_threads=None):
+    """
+    Rebuild the vocabularies of the given language exactly as in training, and load the trained model.
+    """
+    global model
+    if num_threads is not None: torch.set_num_threads(num_threads)
+
+    _, files_paths, _ = get_languages_and_paths(data_dir=data_dir)
+    train_file, _ = reinflection2TSV(files_paths[language], dir_name=tsv_dir, mode=INFLECTION_STR)
+    train_data = TabularDataset(path=train_file, fields=[("src", srcField), ("trg", trgField)], format='tsv')
+    srcField.build_vocab(train_data)
+    trgField.build_vocab(train_data)
+
+    model = Seq2Seq.from_hyper_parameters(encoder_embedding_size, decoder_embedding_size, hidden_size,
+                                          num_layers, encoder_dropout, decoder_dropout).to(device)
+    model.load_state_dict(torch.load(checkpoint_path, map_location=device)["state_dict"])
+    model.eval()
+
+
+def read_samples(lines):
+    """
+    Yield (lemma, form, feat) tuples from the given lines. form is None if the line has no gold form.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        line = line.rstrip('\r\n')
+        if line.strip() == '': continue
+        columns = line.split('\t')
+        if len(columns) == 2:
+            lemma, feat = columns
+            yield lemma, None, feat
+        elif len(columns) == 3:
+            lemma, form, feat = columns
+            yield lemma, form, feat
+        else:
+            raise ValueError(f"Line {line_number}: expected 2 (lemma, feat) or 3 (lemma, form, feat) tab-separated "
+                             f"columns, got {len(columns)}")
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def predict_chunk(samples, max_length=50):
+    """
+    Predict the forms of a list of (lemma, form, feat) samples.
+    :return: the predicted forms (as lists of characters, without <eos>), in the order of the samples.
+    """
+    sources = []
+    for lemma, _, feat in samples:
+        src, _ = reinflection2sample((lemma, '', feat), mode=INFLECTION_STR)
+        sources.append(srcField.tokenize(src))
+
+    predictions = [None] * len(samples)
+    order = sorted(range(len(samples)), key=lambda i: len(sources[i]))
+    for _, same_length in groupby(order, key=lambda i: len(sources[i])):
+        same_length = list(same_length)
+        for start in range(0, len(same_length), batch_size):
+            indices = same_length[start:start + batch_size]
+            translations = translate_batch(model, [sources[i] for i in indices], srcField, trgField, device,
+                                           max_length=max_length)
+            for i, prediction in zip(indices, translations):
+                if prediction and prediction[-1] == '<eos>': prediction = prediction[:-1]
+                predictions[i] = prediction
+    return predictions
+
+
+def predict_stream(samples, output_file, chunk_size, workers, language, checkpoint_path):
+    """
+    Write the predictions of the samples to output_file, chunk by chunk and in the input order.
+    :return: the number of samples with a gold form, the number of correct predictions, and the sum of edit distances.
+    """
+    num_gold, num_correct, total_edit_distance = 0, 0, 0
+
+    def write_chunk(chunk, predictions):
+        nonlocal num_gold, num_correct, total_edit_distance
+        for (lemma, form, feat), prediction in zip(chunk, predictions):
+            output_file.write(f"{lemma}\t{''.join(prediction)}\t{feat}\n")
+            if form is None: continue
+            _, trg = reinflection2sample((lemma, form, feat), mode=INFLECTION_STR)
+            target = trgField.tokenize(trg) if trg else []
+            num_gold += 1
+            num_correct += target == prediction
+            total_edit_distance += eval_edit_distance(target, prediction)
+
+    # Load the model in this process as well, so that bad arguments fail before any worker is started
+    init_model(language, checkpoint_path)
+
+    if workers == 1:
+        for chunk in chunks(samples, chunk_size):
+            write_chunk(chunk, predict_chunk(chunk))
+    else:
+        # CUDA can't be re-initialized in a forked process. If a worker fails to initialize, the executor raises
+        # BrokenProcessPool (rather than hanging like multiprocessing.Pool)
+        mp_context = get_context('spawn') if device.type == 'cuda' else None
+        with ProcessPoolExecutor(workers, mp_context=mp_context, initializer=init_model,
+                                 initargs=(language, checkpoint_path, 1)) as executor:
+            # Keep at most 2 chunks per worker in flight, so that the input isn't read faster than it is decoded
+            pending = deque()
+            for chunk in chunks(samples, chunk_size):
+                pending.append((chunk, executor.submit(predict_chunk, chunk)))
+                if len(pending) >= 2 * workers:
+                    chunk, future = pending.popleft()
+                    write_chunk(chunk, future.result())
+            while pending:
+                chunk, future = pending.popleft()
+                write_chunk(chunk, future.result())
+
+    return num_gold, num_correct, total_edit_distance
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1: raise ArgumentTypeError(f"expected a positive integer, got {value}")
+    return number
+
+
+def main():
+    parser = ArgumentParser(description="Stream predictions of a trained model for lemma\\tfeat rows.")
+    parser.add_argument("--language", required=True, help="the language the model was trained on, e.g. 'tgk'")
+    parser.add_argument("--checkpoint", default=None,
+                        help="path to the checkpoint (default: the one saved by Inflection_90_Langs.py)")
+    parser.add_argument("--input", default=None, help="input file (default: stdin)")
+    parser.add_argument("--output", default=None, help="output file (default: stdout)")
+    parser.add_argument("--chunk-size", type=positive_int, default=10000,
+                        help="number of rows held in memory per chunk")
+    parser.add_argument("--workers", type=positive_int, default=1, help="number of worker processes")
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or join('SIG20', training_mode, args.language, "my_checkpoint.pth.tar")
+    # Only close the files opened here, not stdin/stdout
+    input_file = open(args.input, encoding='utf8') if args.input else nullcontext(sys.stdin)
+    output_file = open(args.output, mode='w', encoding='utf8') if args.output else nullcontext(sys.stdout)
+
+    with input_file as input_file, output_file as output_file:
+        num_gold, num_correct, total_edit_distance = predict_stream(read_samples(input_file), output_file,
+                                                                    args.chunk_size, args.workers, args.language,
+                                                                    checkpoint_path)
+
+    if num_gold:
+        print(f"avgED = {total_edit_distance / num_gold}; avgAcc = {num_correct / num_gold} "
+              f"({num_gold} samples with gold forms)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
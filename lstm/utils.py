@@ -66,6 +66,39 @@ def translate_sentence(model, sentence, german, english, device, max_length=50,
         return translated_sentence[1:]
 
 
+def translate_batch(model, sentences, german, english, device, max_length=50):
+    """
+    Greedy-decode a batch of tokenized sentences at once. Equivalent to calling translate_sentence on every sentence
+    when all the sentences have the same length (otherwise the padding is attended to by the encoder & decoder).
+    :return: a list of the translated sentences, each ending with <eos> unless max_length was reached.
+    """
+    sentences_tensor = german.process(sentences, device=device)
+    sos_idx, eos_idx = english.vocab.stoi["<sos>"], english.vocab.stoi["<eos>"]
+
+    with torch.no_grad():
+        outputs_encoder, hiddens, cells = model.encoder(sentences_tensor)
+        encoder_energy = model.decoder.project_encoder_states(outputs_encoder)
+
+        previous_words = torch.full((len(sentences),), sos_idx, dtype=torch.long, device=device)
+        finished = torch.zeros(len(sentences), dtype=torch.bool, device=device)
+        outputs = []
+        for _ in range(max_length):
+            output, hiddens, cells, _ = model.decoder(previous_words, outputs_encoder, hiddens, cells,
+                                                      encoder_energy=encoder_energy)
+            previous_words = output.argmax(1)
+            outputs.append(previous_words)
+
+            # Stop once every sentence has predicted its end
+            finished |= previous_words == eos_idx
+            if finished.all(): break
+
+    translated_sentences = []
+    for indices in torch.stack(outputs, dim=1).tolist():
+        if eos_idx in indices: indices = indices[:indices.index(eos_idx) + 1]
+        translated_sentences.append([english.vocab.itos[idx] for idx in indices])
+    return translated_sentences
+
+
 def evaluate_model(data, model, german, english, device):
     targets, outputs = [], []
 